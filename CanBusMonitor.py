@@ -1,7 +1,8 @@
 import serial
 import time
 import threading
-from collections import defaultdict
+import os
+from collections import defaultdict, deque
 from tkinter import *
 from tkinter import messagebox, filedialog, ttk
 import json
@@ -32,6 +33,22 @@ sending_event = threading.Event()  # To ensure send_all_frames can only be calle
 periodic_event = threading.Event()  # To control the periodic sending of frames
 dirty = threading.Event()
 
+# Trigger capture state: a ring buffer holding the last few seconds of traffic and
+# compiled trigger checks keyed by CAN ID, so untriggered IDs cost a single dict lookup
+trigger_armed = False
+trigger_buffer = deque()
+trigger_conditions = {}
+trigger_period_limits = {}  # PERIOD-triggered IDs -> max period in ms, polled for IDs that stop transmitting
+trigger_timeout_last = {}  # Last frame time each PERIOD gap was already reported (or ignored) for, so one dropout fires once
+trigger_pre_time = 5.0
+trigger_post_time = 5.0
+trigger_fired_time = None
+trigger_fired_id = None
+trigger_output_dir = ""
+trigger_captures = []
+trigger_dropped_time = None  # Time of the newest frame dropped because the buffer was full
+trigger_truncated_captures = 0  # Captures whose window did not fit in the buffer size limit
+
 def process_can_frame(frame):
     frame = frame.strip()
     if not frame:
@@ -44,8 +61,10 @@ def process_can_frame(frame):
 
             current_time = time.time()
             with lock:
-                if can_message_stats[can_id]['last_time'] is not None:
-                    period = (current_time - can_message_stats[can_id]['last_time']) * 1000  # Convert to milliseconds
+                period = None
+                last_time = can_message_stats[can_id]['last_time']
+                if last_time is not None:
+                    period = (current_time - last_time) * 1000  # Convert to milliseconds
                     can_message_stats[can_id]['period'] = period
 
                 can_message_stats[can_id]['last_time'] = current_time
@@ -54,11 +73,172 @@ def process_can_frame(frame):
 
                 if recording:
                     recorded_data.append({'id': can_id, 'time': current_time, 'data': data})
+                if trigger_armed:
+                    buffer_trigger_frame(can_id, current_time, data, period, last_time)
                 dirty.set()
 
         except Exception as e:
             print(f"Error processing frame: {e}")
 
+# Compile a single trigger condition line into (can_id, check, max_period) where check(data, period) -> bool
+# and max_period is the PERIOD limit in ms (None for other conditions)
+# Supported forms (ID in hex, other numbers as 0x.. or decimal):
+#   ID <id>                                  - any frame with this ID
+#   MASK <id> <byte> <mask> <value>          - data[byte] & mask == value
+#   SIGNAL <id> <byte> <length> <op> <thr>   - big-endian signal crossing threshold, op is > or <
+#   PERIOD <id> [<min_ms>] <max_ms>          - period outside the allowed range
+def compile_trigger(line):
+    parts = line.split()
+    kind = parts[0].upper()
+    can_id = int(parts[1], 16)
+    if not 0 <= can_id <= 0x7FF:
+        raise ValueError(f"CAN ID must be within 0x000-0x7FF: {line}")
+    operator = parts.pop(4) if kind == 'SIGNAL' and len(parts) == 6 else None
+    args = [int(arg, 0) for arg in parts[2:]]
+
+    if kind == 'ID' and len(args) == 0:
+        return can_id, lambda data, period: True, None
+
+    if kind == 'MASK' and len(args) == 3:
+        byte_index, mask, value = args
+        if byte_index < 0 or not (0 <= mask <= 0xFF and 0 <= value <= 0xFF):
+            raise ValueError(f"Byte index must be >= 0 and mask/value within 0-255: {line}")
+        return can_id, lambda data, period: len(data) > byte_index and data[byte_index] & mask == value, None
+
+    if kind == 'SIGNAL' and operator in ('>', '<') and len(args) == 3:
+        start, length, threshold = args
+        if start < 0 or length < 1:
+            raise ValueError(f"Signal start must be >= 0 and length >= 1: {line}")
+        rising = operator == '>'
+        last_value = None
+
+        def check_signal(data, period):
+            nonlocal last_value
+            if len(data) < start + length:
+                return False
+            value = int.from_bytes(bytes(data[start:start + length]), 'big')
+            previous, last_value = last_value, value
+            if previous is None:
+                return False
+            if rising:
+                return previous <= threshold < value
+            return previous >= threshold > value
+        return can_id, check_signal, None
+
+    if kind == 'PERIOD' and len(args) in (1, 2):
+        min_period, max_period = (args[0], args[1]) if len(args) == 2 else (0, args[0])
+        if min_period < 0 or min_period > max_period:
+            raise ValueError(f"Period range must satisfy 0 <= min <= max: {line}")
+        check = lambda data, period: period is not None and not (min_period <= period <= max_period)
+        return can_id, check, max_period
+
+    raise ValueError(f"Invalid trigger condition: {line}")
+
+# Returns (conditions, period_limits): checks keyed by CAN ID and the tightest PERIOD max per ID
+def compile_triggers(text):
+    conditions = defaultdict(list)
+    period_limits = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        can_id, check, max_period = compile_trigger(line)
+        conditions[can_id].append(check)
+        if max_period is not None:
+            period_limits[can_id] = min(max_period, period_limits.get(can_id, max_period))
+    return dict(conditions), period_limits
+
+# Mark the current gap of every PERIOD-triggered ID as already reported, so gaps from before
+# arming or from a paused monitor don't fire. Called with the lock held
+def ignore_trigger_gaps():
+    for can_id in trigger_period_limits:
+        stats = can_message_stats.get(can_id)
+        if stats and stats['last_time'] is not None:
+            trigger_timeout_last[can_id] = stats['last_time']
+
+# Called from process_can_frame with the lock held
+def buffer_trigger_frame(can_id, current_time, data, period, last_time):
+    global trigger_fired_time, trigger_fired_id, trigger_dropped_time
+
+    # Keep only the pre-trigger window, or everything since it once a trigger has fired
+    cutoff = (trigger_fired_time if trigger_fired_time is not None else current_time) - trigger_pre_time
+    while trigger_buffer and trigger_buffer[0]['time'] < cutoff:
+        trigger_buffer.popleft()
+    if len(trigger_buffer) == trigger_buffer.maxlen:
+        trigger_dropped_time = trigger_buffer[0]['time']  # The append below drops the oldest frame
+    trigger_buffer.append({'id': can_id, 'time': current_time, 'data': data})
+
+    checks = trigger_conditions.get(can_id)
+    if checks:
+        if last_time is not None and trigger_timeout_last.get(can_id) == last_time:
+            period = None  # This gap was already reported by check_trigger_timeouts (or predates arming)
+        fired = False
+        for check in checks:  # Run every check so stateful ones (signal crossing) stay up to date
+            if check(data, period):
+                fired = True
+        if fired and trigger_fired_time is None:
+            trigger_fired_time = current_time
+            trigger_fired_id = can_id
+
+    if trigger_fired_time is not None:
+        if current_time - trigger_fired_time >= trigger_post_time:
+            dump_trigger_window()
+        elif len(trigger_buffer) == trigger_buffer.maxlen:
+            # The next append would drop pre-trigger frames, so save what we have now
+            print(f"Trigger buffer full: post-trigger window cut short after {current_time - trigger_fired_time:.2f} s")
+            dump_trigger_window(truncated=True)
+
+# Called with the lock held; file writing happens on a separate thread
+def dump_trigger_window(truncated=False):
+    global trigger_fired_time, trigger_fired_id, trigger_truncated_captures
+    cutoff = trigger_fired_time - trigger_pre_time
+    while trigger_buffer and trigger_buffer[0]['time'] < cutoff:
+        trigger_buffer.popleft()
+    if trigger_dropped_time is not None and trigger_dropped_time >= cutoff:
+        print(f"Trigger buffer full: pre-trigger window cut to {trigger_fired_time - trigger_buffer[0]['time']:.2f} s")
+        truncated = True
+    if truncated:
+        trigger_truncated_captures += 1
+    frames = list(trigger_buffer)
+    fired_time, fired_id = trigger_fired_time, trigger_fired_id
+    trigger_fired_time = None
+    trigger_fired_id = None
+    threading.Thread(target=save_trigger_capture, args=(frames, fired_id, fired_time), daemon=True).start()
+
+def save_trigger_capture(frames, can_id, fired_time):
+    timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(fired_time))
+    file_name = f"trigger_0x{can_id:03X}_{timestamp}_{int(fired_time * 1000) % 1000:03d}.json"
+    file_path = os.path.join(trigger_output_dir, file_name)
+    try:
+        with open(file_path, 'w') as file:
+            json.dump(frames, file)
+        trigger_captures.append(file_path)
+        print(f"Trigger on ID 0x{can_id:03X}: saved {len(frames)} frames to {file_path}")
+    except OSError as e:
+        print(f"Error saving trigger capture: {e}")
+
+# Polled from display_can_data: fires PERIOD triggers for IDs that stopped transmitting and dumps
+# a pending capture whose post-trigger window elapsed without further frames arriving
+def check_trigger_timeouts():
+    global trigger_fired_time, trigger_fired_id
+    with lock:
+        if not trigger_armed:
+            return
+        current_time = time.time()
+        if trigger_fired_time is None:
+            for can_id, max_period in trigger_period_limits.items():
+                stats = can_message_stats.get(can_id)
+                last_time = stats['last_time'] if stats else None
+                if last_time is None or trigger_timeout_last.get(can_id) == last_time:
+                    continue
+                if (current_time - last_time) * 1000 > max_period:
+                    trigger_timeout_last[can_id] = last_time
+                    trigger_fired_time = current_time
+                    trigger_fired_id = can_id
+                    break
+        if trigger_fired_time is not None and current_time - trigger_fired_time >= trigger_post_time:
+            dump_trigger_window()
+
 def read_serial():
     buffer = ""
     while not stop_event.is_set():
@@ -94,6 +274,7 @@ def display_can_data():
                 text_output.delete('1.0', END)
                 text_output.insert(END, output)
             dirty.clear()
+        check_trigger_timeouts()
         time.sleep(0.5)  # Adjusted the sleep to 0.5 seconds to balance update frequency
 
 def reset_stats():
@@ -558,9 +739,137 @@ def display_com_logger():
     com_stop_event.clear()
     threading.Thread(target=read_com_data, daemon=True).start()
 
+def display_trigger_window():
+    def choose_output_dir():
+        directory = filedialog.askdirectory()
+        if directory:
+            dir_var.set(directory)
+
+    def arm_trigger():
+        global trigger_armed, trigger_buffer, trigger_conditions, trigger_period_limits, trigger_timeout_last
+        global trigger_pre_time, trigger_post_time, trigger_fired_time, trigger_fired_id, trigger_output_dir
+        global trigger_dropped_time
+        try:
+            conditions, period_limits = compile_triggers(conditions_text.get('1.0', END))
+        except (ValueError, IndexError) as e:
+            messagebox.showerror("Trigger Error", f"{e}")
+            return
+        if not conditions:
+            messagebox.showerror("Trigger Error", "Please enter at least one trigger condition.")
+            return
+        try:
+            pre_time = float(pre_var.get())
+            post_time = float(post_var.get())
+            max_frames = int(max_frames_var.get())
+        except ValueError:
+            messagebox.showerror("Trigger Error", "Please enter valid pre/post times and buffer size.")
+            return
+        if pre_time < 0 or post_time < 0 or max_frames <= 0:
+            messagebox.showerror("Trigger Error", "Pre/post times must be >= 0 and buffer size must be > 0.")
+            return
+        output_dir = dir_var.get()
+        if not os.path.isdir(output_dir):
+            messagebox.showerror("Trigger Error", "Please select an existing output directory.")
+            return
+        buffer = deque(maxlen=max_frames)
+
+        with lock:
+            if trigger_armed and trigger_fired_time is not None:
+                dump_trigger_window()  # Save the pending capture before the buffer is replaced
+            trigger_conditions = conditions
+            trigger_period_limits = period_limits
+            trigger_timeout_last = {}
+            ignore_trigger_gaps()
+            trigger_pre_time = pre_time
+            trigger_post_time = post_time
+            trigger_output_dir = output_dir
+            trigger_buffer = buffer
+            trigger_fired_time = None
+            trigger_fired_id = None
+            trigger_dropped_time = None
+            trigger_armed = True
+
+    def disarm_trigger():
+        global trigger_armed
+        with lock:
+            if trigger_fired_time is not None:
+                dump_trigger_window()  # Save the pending capture with whatever post-trigger data we have
+            trigger_armed = False
+            trigger_buffer.clear()
+
+    def refresh():
+        if not trigger_window.winfo_exists():
+            return
+        with lock:
+            armed, fired_id, buffered = trigger_armed, trigger_fired_id, len(trigger_buffer)
+            truncated = trigger_truncated_captures
+        if not armed:
+            state = "Disarmed"
+        elif fired_id is not None:
+            state = f"Triggered on ID 0x{fired_id:03X}, capturing post-trigger frames"
+        else:
+            state = "Armed"
+        status_var.set(f"{state} | Buffered frames: {buffered} | Captures saved: {len(trigger_captures)} | Truncated: {truncated}")
+        trigger_window.after(500, refresh)
+
+    def on_close_trigger_window():
+        disarm_trigger()
+        trigger_window.destroy()
+
+    trigger_window = Toplevel(root)
+    trigger_window.title("Trigger Capture")
+    trigger_window.geometry("800x600")
+    trigger_window.protocol("WM_DELETE_WINDOW", on_close_trigger_window)
+
+    help_label = Label(trigger_window, justify=LEFT, text=(
+        "One condition per line (ID in hex):\n"
+        "  ID 0x123\n"
+        "  MASK 0x123 <byte> <mask> <value>\n"
+        "  SIGNAL 0x123 <start byte> <length> > <threshold>   (or <)\n"
+        "  PERIOD 0x123 [<min ms>] <max ms>"))
+    help_label.pack(fill=X, padx=5, pady=5)
+
+    conditions_text = Text(trigger_window, height=10)
+    conditions_text.pack(fill=BOTH, expand=True, padx=5, pady=5)
+
+    settings_frame = Frame(trigger_window)
+    settings_frame.pack(fill=X)
+
+    pre_var = StringVar(value=str(trigger_pre_time))
+    post_var = StringVar(value=str(trigger_post_time))
+    max_frames_var = StringVar(value="100000")
+    dir_var = StringVar(value=trigger_output_dir or os.getcwd())
+
+    Label(settings_frame, text="Pre-trigger (s):").pack(side=LEFT, padx=5, pady=5)
+    Entry(settings_frame, textvariable=pre_var, width=6).pack(side=LEFT, padx=5, pady=5)
+    Label(settings_frame, text="Post-trigger (s):").pack(side=LEFT, padx=5, pady=5)
+    Entry(settings_frame, textvariable=post_var, width=6).pack(side=LEFT, padx=5, pady=5)
+    Label(settings_frame, text="Max buffered frames:").pack(side=LEFT, padx=5, pady=5)
+    Entry(settings_frame, textvariable=max_frames_var, width=8).pack(side=LEFT, padx=5, pady=5)
+
+    dir_frame = Frame(trigger_window)
+    dir_frame.pack(fill=X)
+
+    Label(dir_frame, text="Output directory:").pack(side=LEFT, padx=5, pady=5)
+    Entry(dir_frame, textvariable=dir_var).pack(side=LEFT, fill=X, expand=True, padx=5, pady=5)
+    Button(dir_frame, text="Browse", command=choose_output_dir).pack(side=LEFT, padx=5, pady=5)
+
+    status_var = StringVar()
+    status_label = Label(trigger_window, textvariable=status_var, anchor=W)
+    status_label.pack(fill=X, padx=5, pady=5)
+
+    arm_btn = Button(trigger_window, text="Arm Trigger", command=arm_trigger)
+    arm_btn.pack(side=LEFT, padx=5, pady=5)
+    disarm_btn = Button(trigger_window, text="Disarm Trigger", command=disarm_trigger)
+    disarm_btn.pack(side=LEFT, padx=5, pady=5)
+
+    refresh()
+
 def resume_monitoring():
     resume_btn.pack_forget()  # Hide the resume button
     stop_event.clear()  # Clear stop_event to restart reading
+    with lock:
+        ignore_trigger_gaps()  # The pause is not a period violation
     threading.Thread(target=read_serial, daemon=True).start()
     threading.Thread(target=display_can_data, daemon=True).start()
 
@@ -644,6 +953,9 @@ def main():
     com_logger_btn = Button(btn_frame, text="COM Logger", command=display_com_logger, bg='black', fg='white')
     com_logger_btn.pack(side=LEFT, padx=5, pady=5)
 
+    trigger_btn = Button(btn_frame, text="Trigger Capture", command=display_trigger_window, bg='black', fg='white')
+    trigger_btn.pack(side=LEFT, padx=5, pady=5)
+
     resume_btn = Button(btn_frame, text="Resume Monitoring", command=resume_monitoring, bg='black', fg='white')
     resume_btn.pack_forget()  # Hide the resume button initially
 